@@ -1,7 +1,9 @@
-import os, base64, datetime, requests
-from typing import Optional, Dict, Any, List
-from fastapi import FastAPI, HTTPException, Header, Query, Depends
+import os, re, time, asyncio, contextlib, functools, itertools, httpx, orjson, pybase64
+from typing import Optional, Dict, Any, List, AsyncGenerator
+from fastapi import FastAPI, HTTPException, Header, Query, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from cachetools import TTLCache
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 
@@ -16,51 +18,190 @@ SERVICE_API_KEY = os.environ["SERVICE_API_KEY"]
 
 # Load private key for request signing
 _private_key = serialization.load_pem_private_key(PRIVATE_PEM, password=None)
+_sign_fn = _private_key.sign
 
+# Shared HTTP/2 client so pagination multiplexes over one warm TLS connection to Kalshi
+_client = httpx.AsyncClient(
+    base_url=BASE,
+    timeout=30,
+    # /markets pages compress well; httpx decodes br via the brotli extra
+    headers={"Accept-Encoding": "gzip, br", "KALSHI-ACCESS-KEY": ACCESS_KEY},
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+        retries=2,  # connect failures only; status retries live in _authed_get_raw
+    ),
+)
+
+# Upstream statuses worth retrying, with the same signed headers
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_MAX_RETRIES = 2
+_BACKOFF_S = 0.2
+
+# Short-lived response caches; orderbooks move faster than market listings
+_markets_cache: TTLCache = TTLCache(maxsize=512, ttl=10)
+_orderbook_cache: TTLCache = TTLCache(maxsize=512, ttl=1)
+
+def _cache_for(short_path: str) -> TTLCache:
+    return _orderbook_cache if short_path.endswith("/orderbook") else _markets_cache
+
+# Signing parameters, built once rather than per signature
+_SHA256 = hashes.SHA256()
+_PSS = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH)
+
+# Constant part of the signed message for GET requests
+_METHOD_GET_PREFIX = ("GET" + API_PREFIX).encode()
+
+@functools.lru_cache(maxsize=2048)
 def _sign(ts_ms: str, method: str, short_path: str) -> str:
-    msg = f"{ts_ms}{method.upper()}{API_PREFIX}{short_path}".encode()
-    sig = _private_key.sign(
-        msg,
-        padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH),
-        hashes.SHA256(),
-    )
-    return base64.b64encode(sig).decode()
-
-def _authed_get(short_path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    ts = str(int(datetime.datetime.now().timestamp() * 1000))
+    method = method.upper()
+    prefix = _METHOD_GET_PREFIX if method == "GET" else (method + API_PREFIX).encode()
+    msg = ts_ms.encode() + prefix + short_path.encode()
+    return pybase64.b64encode(_sign_fn(msg, _PSS, _SHA256)).decode()
+
+async def _authed_get_raw(short_path: str, params: Optional[Dict[str, Any]] = None) -> bytes:
+    cache = _cache_for(short_path)
+    key = (short_path, tuple(sorted((params or {}).items())))
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+
+    ts = str(time.time_ns() // 1_000_000)
+    # RSA signing is the one CPU-bound step; keep it off the event loop thread
+    signature = await asyncio.to_thread(_sign, ts, "GET", short_path)
     headers = {
-        "KALSHI-ACCESS-KEY": ACCESS_KEY,
         "KALSHI-ACCESS-TIMESTAMP": ts,
-        "KALSHI-ACCESS-SIGNATURE": _sign(ts, "GET", short_path),
+        "KALSHI-ACCESS-SIGNATURE": signature,
     }
-    r = requests.get(f"{BASE}{short_path}", params=params, headers=headers, timeout=30)
+    # Build URL, querystring and merged headers once; retries resend the same request
+    request = _client.build_request("GET", short_path, params=params, headers=headers)
+    for attempt in range(_MAX_RETRIES + 1):
+        r = await _client.send(request)
+        if r.status_code not in _RETRY_STATUSES or attempt == _MAX_RETRIES:
+            break
+        await asyncio.sleep(_BACKOFF_S * 2 ** attempt)
     if r.status_code != 200:
         raise HTTPException(status_code=r.status_code, detail=r.text)
-    return r.json()
+    cache[key] = r.content
+    return r.content
+
+async def _authed_get(short_path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return orjson.loads(await _authed_get_raw(short_path, params))
+
+async def _iter_market_pages(base_params: Dict[str, Any], max_markets: int) -> AsyncGenerator[List[Dict[str, Any]], None]:
+    """
+    Yields /markets pages with cursor pagination until max_markets have been
+    yielded or there are no more pages. The next page is requested as soon as
+    its cursor is known, so it is in flight while the caller handles the current one.
+    Each cursor only arrives with the previous page, so one page ahead is the
+    deepest prefetch Kalshi's pagination allows.
+    """
+    params = dict(base_params)
+    params["limit"] = min(100, max(1, max_markets))  # Kalshi caps page size
+    seen = 0
+
+    pending: Optional[asyncio.Task] = asyncio.create_task(_authed_get("/markets", params))
+    try:
+        while pending is not None:
+            data = await pending
+            pending = None
+            batch = data.get("markets", [])
+            room = max_markets - seen
+            if len(batch) >= room:
+                # Last page we need; trim it here rather than slicing the whole result
+                yield batch[:room]
+                return
+            cursor = data.get("cursor")
+            if cursor and batch:
+                pending = asyncio.create_task(_authed_get("/markets", {**params, "cursor": cursor}))
+            seen += len(batch)
+            yield batch
+    finally:
+        # Caller stopped early; drop the prefetched page
+        if pending is not None:
+            pending.cancel()
 
-def _paged_markets(base_params: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+async def _paged_markets(base_params: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
     """
     Pulls markets with cursor pagination until reaching limit or no more pages.
     """
     out: List[Dict[str, Any]] = []
-    params = dict(base_params)
-    params["limit"] = min(100, max(1, limit))  # Kalshi caps page size
-    cursor = None
-
-    while len(out) < limit:
-        if cursor:
-            params["cursor"] = cursor
-        data = _authed_get("/markets", params)
-        batch = data.get("markets", [])
-        out.extend(batch)
-        cursor = data.get("cursor")
-        if not cursor or not batch:
+    out_extend = out.extend
+    async with contextlib.aclosing(_iter_market_pages(base_params, limit)) as pages:
+        async for batch in pages:
+            out_extend(batch)
+    return out
+
+# Upper bound on markets scanned by one keyword search, matching the largest limit
+_MAX_SEARCH_SCAN = 1000
+
+async def _search_markets(base_params: Dict[str, Any], keyword: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    Filters pages as they arrive and stops paging once limit hits are found,
+    or after _MAX_SEARCH_SCAN markets.
+    """
+    hits: List[Dict[str, Any]] = []
+    async with contextlib.aclosing(_iter_market_pages(base_params, _MAX_SEARCH_SCAN)) as pages:
+        async for batch in pages:
+            hits.extend(_filter_markets(batch, keyword))
+            if len(hits) >= limit:
+                break
+    return hits[:limit]
+
+# Kalshi tickers look like SERIES-EVENT or SERIES-EVENT-MARKET
+_TICKER_RE = re.compile(r"[A-Z0-9.]+(?:-[A-Z0-9.]+)+")
+
+def _ticker_params(keyword: str) -> Dict[str, Any]:
+    """
+    Maps a ticker-shaped keyword onto its series so Kalshi only returns that
+    series' markets. This is a superset filter; _filter_markets still does the
+    substring match. Returns {} for free text.
+    """
+    kw = keyword.strip().upper()
+    if not _TICKER_RE.fullmatch(kw):
+        return {}
+    return {"series_ticker": kw.split("-")[0]}
+
+# Row separator for the search buffer; never present in titles or tickers
+_ROW_SEP = "\x00"
+
+def _filter_markets(markets: List[Dict[str, Any]], keyword: str) -> List[Dict[str, Any]]:
+    """
+    Keeps markets whose "title ticker" contains keyword, case-insensitively.
+    Lowercases one joined buffer and walks it with str.find, instead of
+    building and lowercasing a string per market.
+    """
+    kw = keyword.lower()
+    if _ROW_SEP in kw:
+        return []
+    rows = ((m.get("title") or "", " ", m.get("ticker") or "", _ROW_SEP) for m in markets)
+    buf = "".join(itertools.chain.from_iterable(rows)).lower()
+
+    hits: List[Dict[str, Any]] = []
+    row, start = 0, 0  # start is the offset where markets[row] begins
+    while True:
+        pos = buf.find(kw, start)
+        if pos < 0:
             break
+        row += buf.count(_ROW_SEP, start, pos)
+        hits.append(markets[row])
+        start = buf.find(_ROW_SEP, pos) + 1
+        row += 1
+    return hits
 
-    return out[:limit]
+# Close the shared client's connections when the worker stops
+@contextlib.asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    yield
+    await _client.aclose()
 
 # FastAPI app
-app = FastAPI(title="Kalshi Odds Proxy", version="1.1.0")
+app = FastAPI(
+    title="Kalshi Odds Proxy",
+    version="1.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=_lifespan,
+)
 
 # CORS
 app.add_middleware(
@@ -86,29 +227,37 @@ def openapi_json():
     return app.openapi()
 
 @app.get("/odds/search", dependencies=[Depends(require_service_key)])
-def odds_search(
+async def odds_search(
     keyword: Optional[str] = Query(None, description="Keyword to match in title or ticker. If omitted, returns all."),
     status: Optional[str] = Query(None, description="Filter by market status, for example open, closed, settled, active."),
-    limit: int = Query(300, ge=1, le=1000)
+    limit: int = Query(300, ge=1, le=1000, description="Max markets to return. With a keyword, max matches; at most 1000 markets are scanned.")
 ):
     """
-    If keyword is provided, filters client side over the paged list.
+    If keyword is provided, returns up to limit markets matching it, filtered client
+    side page by page and stopping as soon as limit matches are found. Keywords that
+    look like an event or market ticker first narrow the scan to their series;
+    if that finds nothing, the unnarrowed list is scanned.
     If keyword is omitted, returns the raw paged list up to limit.
     """
     base_params: Dict[str, Any] = {}
     if status:
         base_params["status"] = status
 
-    markets = _paged_markets(base_params, limit)
+    if not keyword:
+        markets = await _paged_markets(base_params, limit)
+        return {"count": len(markets), "markets": markets}
 
-    if keyword:
-        kw = keyword.lower()
-        markets = [m for m in markets if kw in (m.get("title", "") + " " + m.get("ticker", "")).lower()]
+    markets = []
+    narrowed = _ticker_params(keyword)
+    if narrowed:
+        markets = await _search_markets({**base_params, **narrowed}, keyword, limit)
+    if not markets:
+        markets = await _search_markets(base_params, keyword, limit)
 
     return {"count": len(markets), "markets": markets}
 
 @app.get("/odds/series", dependencies=[Depends(require_service_key)])
-def odds_series(
+async def odds_series(
     series_ticker: str = Query(..., description="Kalshi series ticker, for example KXSWENCOUNTERS"),
     status: Optional[str] = Query(None, description="Filter by market status"),
     limit: int = Query(300, ge=1, le=1000)
@@ -117,9 +266,11 @@ def odds_series(
     if status:
         base_params["status"] = status
 
-    markets = _paged_markets(base_params, limit)
+    markets = await _paged_markets(base_params, limit)
     return {"count": len(markets), "markets": markets}
 
 @app.get("/odds/orderbook", dependencies=[Depends(require_service_key)])
-def odds_orderbook(ticker: str = Query(..., description="Exact market ticker")):
-    return _authed_get(f"/markets/{ticker}/orderbook")
+async def odds_orderbook(ticker: str = Query(..., description="Exact market ticker")):
+    # Pure passthrough, so hand Kalshi's bytes straight back instead of re-encoding them
+    body = await _authed_get_raw(f"/markets/{ticker}/orderbook")
+    return Response(content=body, media_type="application/json")